@@ -4,11 +4,22 @@ SMB REST API Service
 A Flask-based REST API for SMB file operations with signing support.
 """
 
-import os
-import json
+import sys
+
+# gevent must patch the stdlib (socket, ssl, threading) before anything else
+# imports it, so the flag is checked here rather than after argument parsing
+if __name__ == '__main__' and '--use-gevent' in sys.argv:
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        print("Error: gevent not found. Install with: pip install gevent")
+        exit(1)
+
+import io
 import logging
-import tempfile
 import base64
+import itertools
 from pathlib import Path
 from typing import Dict, Any
 from datetime import datetime
@@ -23,13 +34,22 @@ except ImportError:
     print("Environment variables will be loaded from system environment only.")
 
 try:
-    from flask import Flask, request, jsonify, send_file
+    from flask import Flask, Response, request, jsonify, stream_with_context
     from werkzeug.utils import secure_filename
-    from werkzeug.exceptions import BadRequest
+    from werkzeug.exceptions import HTTPException
+    from werkzeug.wsgi import FileWrapper
 except ImportError:
     print("Error: Flask not found. Install with: pip install flask")
     exit(1)
 
+try:
+    import orjson
+    from flask.json.provider import JSONProvider
+except ImportError:
+    orjson = None
+    print("Warning: orjson not found. Install with: pip install orjson")
+    print("Falling back to the standard library json module.")
+
 # Import our SMB service
 try:
     from smb_service import SMBFileService, SMBConfig, load_config_from_env, load_config_from_file
@@ -44,8 +64,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+if orjson is not None:
+    class OrjsonProvider(JSONProvider):
+        """Flask JSON provider backed by orjson"""
+        
+        def dumps(self, obj: Any, **kwargs: Any) -> str:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        
+        def loads(self, s, **kwargs: Any) -> Any:
+            return orjson.loads(s)
+        
+        def response(self, *args: Any, **kwargs: Any) -> Response:
+            # Hand orjson's bytes to the response without a str round-trip
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(
+                orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+                mimetype='application/json'
+            )
+
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
+# Multipart text fields (remote_path, create_dirs) are tiny, anything larger is
+# rejected instead of buffered. Werkzeug also applies this to its 64KB parser
+# reads, so it cannot go lower. File parts spool to a temporary file.
+app.config['MAX_FORM_MEMORY_SIZE'] = 128 * 1024
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+
+def _static_error(message: str) -> bytes:
+    """Serialize a fixed error body once at import time"""
+    return app.json.dumps({'status': 'error', 'error': message}).encode('utf-8')
+
+def _error_response(body: bytes, status: int) -> Response:
+    """Build an error response from a pre-serialized body"""
+    # Only the body is shared, Response objects are mutable per request
+    return Response(body, status=status, mimetype='application/json')
+
+# Pre-serialized bodies for errors whose content never changes
+_ERR_NO_SERVICE = _static_error('SMB service not initialized')
+_ERR_NO_FILE_SELECTED = _static_error('No file selected')
+_ERR_JSON_UPLOAD_FIELDS = _static_error('JSON upload requires file_data (base64) and filename fields')
+_ERR_NO_FILE_DATA = _static_error('No file data provided')
+_ERR_NO_FILENAME_HEADER = _static_error('X-Filename header is required')
+_ERR_NO_REMOTE_PATH = _static_error('remote_path is required')
+_ERR_NO_REMOTE_PATH_PARAM = _static_error('remote_path parameter is required')
+_ERR_DELETE_NOT_IMPLEMENTED = _static_error('Delete functionality not yet implemented in SMB service')
+_ERR_FILE_TOO_LARGE = _static_error('Request too large. Maximum file size is 100MB, form fields are limited to 128KB.')
+_ERR_BAD_REQUEST = _static_error('Bad request')
+_ERR_RANGE_NOT_SATISFIABLE = _static_error('Requested range not satisfiable')
+_ERR_INTERNAL = _static_error('Internal server error')
 
 # Global SMB service instance
 smb_service = None
@@ -74,19 +141,37 @@ def init_smb_service_from_config(config_path: str):
         logger.error(f"Failed to initialize SMB service from config file: {e}")
         return False
 
+@app.before_request
 def require_smb_service():
-    """Decorator to ensure SMB service is initialized"""
-    def decorator(f):
-        def wrapper(*args, **kwargs):
-            if smb_service is None:
-                return jsonify({
-                    'status': 'error',
-                    'error': 'SMB service not initialized'
-                }), 500
-            return f(*args, **kwargs)
-        wrapper.__name__ = f.__name__
-        return wrapper
-    return decorator
+    """Ensure SMB service is initialized before serving any /smb/ route"""
+    if smb_service is None and request.path.startswith('/smb/'):
+        return _error_response(_ERR_NO_SERVICE, 500)
+
+def _iter_base64_json(remote_f, result: Dict[str, Any]):
+    """Yield result as JSON with file content streamed into its file_data field"""
+    yield app.json.dumps(result)[:-1].encode('utf-8') + b', "file_data": "'
+    
+    # Raw SMB reads may come back short, only encode whole 3-byte groups so
+    # the concatenated pieces form a single valid base64 string
+    leftover = b''
+    for chunk in iter(lambda: remote_f.read(smb_service.chunk_read), b''):
+        chunk = leftover + chunk
+        cut = len(chunk) - len(chunk) % 3
+        leftover = chunk[cut:]
+        yield base64.b64encode(chunk[:cut])
+    
+    yield base64.b64encode(leftover) + b'"}'
+
+def _iter_listing_json(entries, result: Dict[str, Any]):
+    """Yield result as JSON with directory entries streamed into its files array"""
+    yield app.json.dumps(result)[:-1] + ', "files": ['
+    
+    count = 0
+    for entry in entries:
+        yield (',' if count else '') + app.json.dumps(entry)
+        count += 1
+    
+    yield f'], "count": {count}}}'
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -99,7 +184,6 @@ def health_check():
     })
 
 @app.route('/smb/test', methods=['GET'])
-@require_smb_service()
 def test_connection():
     """Test SMB connection"""
     try:
@@ -114,14 +198,38 @@ def test_connection():
         }), 500
 
 @app.route('/smb/files', methods=['GET'])
-@require_smb_service()
 def list_files():
-    """List files in remote directory"""
+    """List files in remote directory, streamed as JSON or NDJSON (?format=ndjson)"""
     try:
         remote_path = request.args.get('path', '')
-        result = smb_service.list_files(remote_path)
-        status_code = 200 if result['status'] == 'success' else 400
-        return jsonify(result), status_code
+        files = smb_service.iter_files(remote_path)
+        
+        # Pull the first entry up front so a bad path is still reported with
+        # a 400 before the streamed response has started
+        try:
+            first = next(files, None)
+        except Exception as e:
+            logger.error(f"List files failed: {e}")
+            return jsonify({
+                'status': 'error',
+                'path': remote_path,
+                'error': str(e)
+            }), 400
+        entries = itertools.chain(() if first is None else (first,), files)
+        
+        if request.args.get('format') == 'ndjson':
+            return Response(
+                stream_with_context(app.json.dumps(entry) + '\n' for entry in entries),
+                mimetype='application/x-ndjson'
+            )
+        
+        return Response(
+            stream_with_context(_iter_listing_json(entries, {
+                'status': 'success',
+                'path': smb_service._remote(remote_path)
+            })),
+            mimetype='application/json'
+        )
     except Exception as e:
         logger.error(f"List files error: {e}")
         return jsonify({
@@ -130,75 +238,53 @@ def list_files():
         }), 500
 
 @app.route('/smb/upload', methods=['POST'])
-@require_smb_service()
 def upload_file():
-    """Upload file to SMB share"""
+    """Upload file to SMB share (large files are best sent to /smb/upload/raw)"""
     try:
         # Check if file or base64 data is provided
-        file_data = None
+        file_stream = None
         filename = None
         
         if 'file' in request.files:
             # Handle multipart file upload
             file = request.files['file']
             if file.filename == '':
-                return jsonify({
-                    'status': 'error',
-                    'error': 'No file selected'
-                }), 400
+                return _error_response(_ERR_NO_FILE_SELECTED, 400)
             
             filename = secure_filename(file.filename)
-            file_data = file.read()
+            file_stream = file.stream
+            
+            remote_path = request.form.get('remote_path', filename)
+            create_dirs = request.form.get('create_dirs', 'true').lower() == 'true'
             
         elif request.is_json:
-            # Handle JSON with base64 encoded file
-            data = request.get_json()
+            # Handle JSON with base64 encoded file, parsed once and reused below
+            data = request.get_json(cache=True)
             if 'file_data' not in data or 'filename' not in data:
-                return jsonify({
-                    'status': 'error',
-                    'error': 'JSON upload requires file_data (base64) and filename fields'
-                }), 400
+                return _error_response(_ERR_JSON_UPLOAD_FIELDS, 400)
             
             try:
-                file_data = base64.b64decode(data['file_data'])
+                file_stream = io.BytesIO(base64.b64decode(data['file_data']))
                 filename = secure_filename(data['filename'])
             except Exception as e:
                 return jsonify({
                     'status': 'error',
                     'error': f'Invalid base64 data: {str(e)}'
                 }), 400
-        else:
-            return jsonify({
-                'status': 'error',
-                'error': 'No file data provided'
-            }), 400
-        
-        # Get remote path
-        if 'file' in request.files:
-            remote_path = request.form.get('remote_path', filename)
-            create_dirs = request.form.get('create_dirs', 'true').lower() == 'true'
-        else:
-            data = request.get_json()
+            
             remote_path = data.get('remote_path', filename)
             create_dirs = data.get('create_dirs', True)
+        else:
+            return _error_response(_ERR_NO_FILE_DATA, 400)
         
-        # Save file temporarily
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_file.write(file_data)
-            temp_path = temp_file.name
-        
-        try:
-            # Upload to SMB
-            result = smb_service.upload_file(temp_path, remote_path, create_dirs)
-            status_code = 200 if result['status'] == 'success' else 400
-            return jsonify(result), status_code
-        finally:
-            # Clean up temp file
-            try:
-                os.unlink(temp_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temp file: {e}")
+        # Stream straight to SMB
+        result = smb_service.upload_fileobj(file_stream, remote_path, create_dirs)
+        status_code = 200 if result['status'] == 'success' else 400
+        return jsonify(result), status_code
                 
+    except HTTPException:
+        # Size limits hit while parsing the body belong to the 413 handler
+        raise
     except Exception as e:
         logger.error(f"Upload error: {e}")
         return jsonify({
@@ -206,68 +292,107 @@ def upload_file():
             'error': str(e)
         }), 500
 
+@app.route('/smb/upload/raw', methods=['POST', 'PUT'])
+def upload_raw_file():
+    """Upload raw request body to SMB share"""
+    try:
+        filename = secure_filename(request.headers.get('X-Filename', ''))
+        if not filename:
+            return _error_response(_ERR_NO_FILENAME_HEADER, 400)
+        
+        remote_path = request.args.get('remote_path', filename)
+        create_dirs = request.args.get('create_dirs', 'true').lower() == 'true'
+        
+        # Body is streamed as-is, no multipart parsing or base64 decoding
+        result = smb_service.upload_fileobj(request.stream, remote_path, create_dirs)
+        status_code = 200 if result['status'] == 'success' else 400
+        return jsonify(result), status_code
+        
+    except HTTPException:
+        # Size limits hit while parsing the body belong to the 413 handler
+        raise
+    except Exception as e:
+        logger.error(f"Raw upload error: {e}")
+        return jsonify({
+            'status': 'error',
+            'error': str(e)
+        }), 500
+
 @app.route('/smb/download', methods=['GET', 'POST'])
-@require_smb_service()
 def download_file():
-    """Download file from SMB share"""
+    """Download file from SMB share as raw octet-stream (base64 JSON with return_file=false)"""
     try:
-        # Get remote path from query params (GET) or JSON body (POST)
-        if request.method == 'GET':
+        # Get remote path from query params (GET/HEAD) or JSON body (POST)
+        if request.method in ('GET', 'HEAD'):
             remote_path = request.args.get('path')
-            return_file = request.args.get('return_file', 'false').lower() == 'true'
+            return_file = request.args.get('return_file', 'true').lower() == 'true'
         else:
             data = request.get_json()
             if not data or 'remote_path' not in data:
-                return jsonify({
-                    'status': 'error',
-                    'error': 'remote_path is required'
-                }), 400
+                return _error_response(_ERR_NO_REMOTE_PATH, 400)
             remote_path = data['remote_path']
-            return_file = data.get('return_file', False)
+            return_file = data.get('return_file', True)
         
         if not remote_path:
+            return _error_response(_ERR_NO_REMOTE_PATH_PARAM, 400)
+        
+        try:
+            remote_f = smb_service.open_remote(remote_path)
+        except Exception as e:
+            logger.error(f"Download failed: {e}")
             return jsonify({
                 'status': 'error',
-                'error': 'remote_path parameter is required'
+                'remote_path': remote_path,
+                'error': str(e)
             }), 400
         
-        # Create temporary file for download
-        temp_file = tempfile.NamedTemporaryFile(delete=False)
-        temp_path = temp_file.name
-        temp_file.close()
-        
         try:
-            # Download from SMB
-            result = smb_service.download_file(remote_path, temp_path, overwrite=True)
-            
-            if result['status'] != 'success':
-                return jsonify(result), 400
+            file_size, last_modified = smb_service.remote_file_info(remote_f)
             
             if return_file:
-                # Return file directly
-                filename = Path(remote_path).name
-                return send_file(
-                    temp_path,
-                    as_attachment=True,
-                    download_name=filename,
-                    mimetype='application/octet-stream'
+                # Stream file content directly. The wrapper is seekable, so Range
+                # requests seek the SMB handle instead of reading past the prefix
+                response = Response(
+                    FileWrapper(remote_f, smb_service.chunk_read),
+                    mimetype='application/octet-stream',
+                    direct_passthrough=True
                 )
-            else:
-                # Return base64 encoded file content
-                with open(temp_path, 'rb') as f:
-                    file_content = base64.b64encode(f.read()).decode('utf-8')
+                # Close the SMB handle once the response is done, even if never iterated
+                response.call_on_close(remote_f.close)
+                response.headers.set('Content-Disposition', 'attachment',
+                                     filename=Path(remote_path).name)
+                response.content_length = file_size
+                response.last_modified = last_modified
+                response.set_etag(f"{file_size}-{int(last_modified.timestamp() * 1000000)}")
                 
-                result['file_data'] = file_content
-                result['encoding'] = 'base64'
-                return jsonify(result), 200
-                
-        finally:
-            # Clean up temp file (unless returning it directly)
-            if not return_file:
-                try:
-                    os.unlink(temp_path)
-                except Exception as e:
-                    logger.warning(f"Failed to delete temp file: {e}")
+                # Honor If-None-Match/If-Modified-Since and Range so retries resume
+                response.make_conditional(request, accept_ranges=True,
+                                          complete_length=file_size)
+            else:
+                # Deprecated: base64 inflates the payload by a third, kept only
+                # for clients that explicitly pass return_file=false
+                response = Response(
+                    stream_with_context(_iter_base64_json(remote_f, {
+                        'status': 'success',
+                        'remote_path': smb_service._remote(remote_path),
+                        'size_bytes': file_size,
+                        'message': 'File downloaded successfully',
+                        'encoding': 'base64'
+                    })),
+                    mimetype='application/json'
+                )
+                response.call_on_close(remote_f.close)
+                response.headers['Deprecation'] = 'true'
+        except Exception:
+            # No response reaches the client, so nothing else closes the handle
+            remote_f.close()
+            raise
+        
+        return response
+    
+    except HTTPException:
+        # e.g. 416 from make_conditional for an unsatisfiable Range
+        raise
                     
     except Exception as e:
         logger.error(f"Download error: {e}")
@@ -277,7 +402,6 @@ def download_file():
         }), 500
 
 @app.route('/smb/delete', methods=['DELETE', 'POST'])
-@require_smb_service()
 def delete_file():
     """Delete file from SMB share"""
     try:
@@ -287,24 +411,15 @@ def delete_file():
         else:
             data = request.get_json()
             if not data or 'remote_path' not in data:
-                return jsonify({
-                    'status': 'error',
-                    'error': 'remote_path is required'
-                }), 400
+                return _error_response(_ERR_NO_REMOTE_PATH, 400)
             remote_path = data['remote_path']
         
         if not remote_path:
-            return jsonify({
-                'status': 'error',
-                'error': 'remote_path parameter is required'
-            }), 400
+            return _error_response(_ERR_NO_REMOTE_PATH_PARAM, 400)
         
         # We need to add delete functionality to the SMB service
         # For now, return not implemented
-        return jsonify({
-            'status': 'error',
-            'error': 'Delete functionality not yet implemented in SMB service'
-        }), 501
+        return _error_response(_ERR_DELETE_NOT_IMPLEMENTED, 501)
         
     except Exception as e:
         logger.error(f"Delete error: {e}")
@@ -314,21 +429,17 @@ def delete_file():
         }), 500
 
 @app.route('/smb/mkdir', methods=['POST'])
-@require_smb_service()
 def create_directory():
     """Create directory on SMB share"""
     try:
         data = request.get_json()
         if not data or 'remote_path' not in data:
-            return jsonify({
-                'status': 'error',
-                'error': 'remote_path is required'
-            }), 400
+            return _error_response(_ERR_NO_REMOTE_PATH, 400)
         
         remote_path = data['remote_path']
         
         # Use the internal method to create directory
-        full_remote_path = f"{smb_service.server_url}/{remote_path.lstrip('/')}"
+        full_remote_path = smb_service._remote(remote_path)
         smb_service._ensure_remote_dir(full_remote_path)
         
         return jsonify({
@@ -346,24 +457,22 @@ def create_directory():
 
 @app.errorhandler(413)
 def file_too_large(e):
-    return jsonify({
-        'status': 'error',
-        'error': 'File too large. Maximum size is 100MB.'
-    }), 413
+    return _error_response(_ERR_FILE_TOO_LARGE, 413)
 
 @app.errorhandler(400)
 def bad_request(e):
-    return jsonify({
-        'status': 'error',
-        'error': 'Bad request'
-    }), 400
+    return _error_response(_ERR_BAD_REQUEST, 400)
+
+@app.errorhandler(416)
+def range_not_satisfiable(e):
+    response = _error_response(_ERR_RANGE_NOT_SATISFIABLE, 416)
+    if getattr(e, 'length', None) is not None:
+        response.headers['Content-Range'] = f"bytes */{e.length}"
+    return response
 
 @app.errorhandler(500)
 def internal_error(e):
-    return jsonify({
-        'status': 'error',
-        'error': 'Internal server error'
-    }), 500
+    return _error_response(_ERR_INTERNAL, 500)
 
 def main():
     """Main function to run the Flask app"""
@@ -373,6 +482,8 @@ def main():
     parser.add_argument('--host', default='127.0.0.1', help='Host to bind to (default: 127.0.0.1)')
     parser.add_argument('--port', type=int, default=5000, help='Port to bind to (default: 5000)')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('--use-gevent', action='store_true',
+                        help='Serve with gevent WSGIServer for concurrent SMB transfers')
     
     args = parser.parse_args()
     
@@ -398,7 +509,12 @@ def main():
     
     # Start Flask app
     logger.info(f"Starting SMB REST API server on {args.host}:{args.port}")
-    app.run(host=args.host, port=args.port, debug=args.debug)
+    if args.use_gevent:
+        # Patched sockets make SMB network waits yield to other greenlets
+        from gevent.pywsgi import WSGIServer
+        WSGIServer((args.host, args.port), app).serve_forever()
+    else:
+        app.run(host=args.host, port=args.port, debug=args.debug)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
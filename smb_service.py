@@ -6,9 +6,14 @@ A Python service for uploading and downloading files via SMB with signing suppor
 
 import os
 import logging
+import hashlib
+import uuid
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, BinaryIO, Iterator, Tuple
 from dataclasses import dataclass
+from datetime import datetime
 import argparse
 import json
 
@@ -27,6 +32,14 @@ except ImportError:
     print("Error: smbprotocol library not found. Install with: pip install smbprotocol")
     exit(1)
 
+# HTTP errors raised by a web request stream (e.g. body size limits) are left
+# for the web layer to answer, the CLI runs without werkzeug installed
+try:
+    from werkzeug.exceptions import HTTPException
+    _PASSTHROUGH_ERRORS = (HTTPException,)
+except ImportError:
+    _PASSTHROUGH_ERRORS = ()
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -34,6 +47,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Chunk size used when streaming data to/from the SMB share, replaced by the
+# server's negotiated MaxReadSize/MaxWriteSize once a session is registered
+COPY_CHUNK_SIZE = 1024 * 1024  # 1MB chunks
+
+# Files above this size are worth splitting into parallel range writes
+PARALLEL_UPLOAD_THRESHOLD = 16 * 1024 * 1024  # 16MB
+
+_REQUIRED_FIELDS = ('server', 'share', 'username', 'password')
+
 @dataclass
 class SMBConfig:
     """SMB connection configuration"""
@@ -46,6 +68,32 @@ class SMBConfig:
     require_signing: bool = True
     encrypt: bool = False
     timeout: int = 30
+    
+    def __post_init__(self):
+        """Validate required fields"""
+        missing = [name for name in _REQUIRED_FIELDS if not getattr(self, name)]
+        if missing:
+            raise ValueError(f"Missing required SMB configuration: {', '.join(missing)}")
+
+# Environment values accepted as true for boolean settings
+_TRUE_VALUES = frozenset(('true', '1', 'yes', 'on'))
+
+def _env_bool(value: str) -> bool:
+    """Parse boolean environment variable value"""
+    return value.lower() in _TRUE_VALUES
+
+# (SMBConfig field, environment variable, default, cast)
+_ENV_FIELDS = (
+    ('server', 'SMB_SERVER', '', str),
+    ('share', 'SMB_SHARE', '', str),
+    ('username', 'SMB_USERNAME', '', str),
+    ('password', 'SMB_PASSWORD', '', str),
+    ('domain', 'SMB_DOMAIN', '', str),
+    ('port', 'SMB_PORT', '445', int),
+    ('require_signing', 'SMB_REQUIRE_SIGNING', 'true', _env_bool),
+    ('encrypt', 'SMB_ENCRYPT', 'false', _env_bool),
+    ('timeout', 'SMB_TIMEOUT', '30', int),
+)
 
 class SMBFileService:
     """SMB File Service for upload/download operations"""
@@ -53,8 +101,18 @@ class SMBFileService:
     def __init__(self, config: SMBConfig):
         self.config = config
         self.server_url = f"//{config.server}/{config.share}"
+        self._prefix = self.server_url + '/'
+        self.chunk_read = COPY_CHUNK_SIZE
+        self.chunk_write = COPY_CHUNK_SIZE
+        # Private connection cache instead of smbclient's global one, so this
+        # instance's session is reused without contending on the shared pool
+        self._cache = {}
         self._setup_client_config()
     
+    def _remote(self, remote_path: str) -> str:
+        """Build full UNC path for a path relative to share root"""
+        return self._prefix + remote_path.lstrip('/')
+    
     def _setup_client_config(self):
         """Configure SMB client with security settings"""
         try:
@@ -64,21 +122,28 @@ class SMBFileService:
                 username = f"{self.config.domain}\\{self.config.username}"
             
             # Register the server session with authentication
-            smbclient.register_session(
+            session = smbclient.register_session(
                 server=self.config.server,
                 username=username,
                 password=self.config.password,
                 port=self.config.port,
                 encrypt=self.config.encrypt,
-                connection_timeout=self.config.timeout
+                connection_timeout=self.config.timeout,
+                connection_cache=self._cache
             )
             
             # Configure client settings for signing
             ClientConfig().require_signing = self.config.require_signing
             
+            # Size reads/writes to what the server negotiated, each chunk is
+            # then a single SMB2 READ/WRITE request
+            self.chunk_read = session.connection.max_read_size
+            self.chunk_write = session.connection.max_write_size
+            
             logger.info(f"SMB session registered for {self.config.server}")
             logger.info(f"SMB signing required: {self.config.require_signing}")
             logger.info(f"Username format: {username}")
+            logger.info(f"SMB max read/write size: {self.chunk_read}/{self.chunk_write}")
             
         except Exception as e:
             logger.error(f"Failed to setup SMB client: {e}")
@@ -103,7 +168,7 @@ class SMBFileService:
                 raise FileNotFoundError(f"Local file not found: {local_path}")
             
             # Construct full remote path
-            full_remote_path = f"{self.server_url}/{remote_path.lstrip('/')}"
+            full_remote_path = self._remote(remote_path)
             
             # Create remote directories if needed
             if create_dirs:
@@ -113,18 +178,12 @@ class SMBFileService:
             # Upload file
             logger.info(f"Uploading {local_path} to {full_remote_path}")
             
-            with open(local_file, 'rb') as local_f:
-                with smbclient.open_file(full_remote_path, mode='wb') as remote_f:
-                    # Copy file in chunks for better performance
-                    chunk_size = 64 * 1024  # 64KB chunks
-                    while True:
-                        chunk = local_f.read(chunk_size)
-                        if not chunk:
-                            break
-                        remote_f.write(chunk)
-            
-            # Get file info for verification
-            file_size = local_file.stat().st_size
+            # The file is read once front to back, let the kernel read ahead.
+            # An unbuffered FileIO makes each chunk one os.read()
+            with open(local_file, 'rb', buffering=0) as local_f:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(local_f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                file_size, sha256 = self._write_remote(local_f, full_remote_path)
             
             logger.info(f"Upload completed: {file_size} bytes")
             
@@ -133,6 +192,7 @@ class SMBFileService:
                 'local_path': str(local_file),
                 'remote_path': full_remote_path,
                 'size_bytes': file_size,
+                'sha256': sha256,
                 'message': 'File uploaded successfully'
             }
             
@@ -145,6 +205,207 @@ class SMBFileService:
                 'error': str(e)
             }
     
+    def upload_file_parallel(self, local_path: str, remote_path: str,
+                             create_dirs: bool = True,
+                             chunk_size: int = 8 * 1024 * 1024,
+                             parallel: int = 4) -> Dict[str, Any]:
+        """
+        Upload a large file to SMB share using parallel range writes
+        
+        Files up to PARALLEL_UPLOAD_THRESHOLD are uploaded sequentially.
+        Writers are unbuffered, so about parallel * chunk_size bytes are held
+        in memory at once.
+        
+        Args:
+            local_path: Path to local file
+            remote_path: Path on SMB share (relative to share root)
+            create_dirs: Create remote directories if they don't exist
+            chunk_size: Size of each range write
+            parallel: Number of concurrent SMB file handles
+            
+        Returns:
+            Dictionary with upload status and metadata. 'sha256' is only
+            present when the file was uploaded sequentially, range writes
+            are not hashed
+        """
+        try:
+            local_file = Path(local_path)
+            if not local_file.exists():
+                raise FileNotFoundError(f"Local file not found: {local_path}")
+            
+            file_size = local_file.stat().st_size
+            if parallel < 2 or file_size <= PARALLEL_UPLOAD_THRESHOLD:
+                return self.upload_file(local_path, remote_path, create_dirs)
+            
+            # Construct full remote path
+            full_remote_path = self._remote(remote_path)
+            
+            # Create remote directories if needed
+            if create_dirs:
+                remote_dir = str(Path(full_remote_path).parent)
+                self._ensure_remote_dir(remote_dir)
+            
+            logger.info(f"Uploading {local_path} to {full_remote_path} "
+                        f"({parallel} parallel writers, {chunk_size} byte chunks)")
+            
+            # Write a temporary file next to the target and replace the target
+            # only once every range landed, like the sequential upload
+            temp_path = self._temp_remote(full_remote_path)
+            try:
+                # Pre-create the remote file at its final size
+                with smbclient.open_file(temp_path, mode='wb',
+                                         connection_cache=self._cache) as remote_f:
+                    remote_f.truncate(file_size)
+                
+                # Each writer owns one handle and every parallel-th chunk
+                offsets = range(0, file_size, chunk_size)
+                with ThreadPoolExecutor(max_workers=parallel) as executor:
+                    futures = [
+                        executor.submit(self._upload_ranges, local_file, temp_path,
+                                        offsets[i::parallel], chunk_size)
+                        for i in range(parallel)
+                    ]
+                    for future in futures:
+                        future.result()
+                
+                smbclient.replace(temp_path, full_remote_path, connection_cache=self._cache)
+            except BaseException:
+                self._discard_remote(temp_path)
+                raise
+            
+            logger.info(f"Upload completed: {file_size} bytes")
+            
+            return {
+                'status': 'success',
+                'local_path': str(local_file),
+                'remote_path': full_remote_path,
+                'size_bytes': file_size,
+                'message': 'File uploaded successfully'
+            }
+            
+        except Exception as e:
+            logger.error(f"Parallel upload failed: {e}")
+            return {
+                'status': 'error',
+                'local_path': local_path,
+                'remote_path': remote_path,
+                'error': str(e)
+            }
+    
+    def _upload_ranges(self, local_file: Path, full_remote_path: str,
+                       offsets: range, chunk_size: int):
+        """Write the given chunk offsets of a local file into an existing remote file"""
+        with open(local_file, 'rb') as local_f:
+            # Other writers hold the same file open, the default share mask of
+            # 0 would lock it exclusively and fail with a sharing violation
+            with smbclient.open_file(full_remote_path, mode='r+b', share_access='rw',
+                                     buffering=0,
+                                     connection_cache=self._cache) as remote_f:
+                for offset in offsets:
+                    local_f.seek(offset)
+                    remote_f.seek(offset)
+                    self._write_all(remote_f, local_f.read(chunk_size))
+    
+    def upload_fileobj(self, src_stream: BinaryIO, remote_path: str,
+                       create_dirs: bool = True) -> Dict[str, Any]:
+        """
+        Upload a readable binary stream to SMB share without staging it locally
+        
+        Args:
+            src_stream: Readable binary file-like object (e.g. a request stream)
+            remote_path: Path on SMB share (relative to share root)
+            create_dirs: Create remote directories if they don't exist
+            
+        Returns:
+            Dictionary with upload status and metadata
+            
+        Raises:
+            werkzeug.exceptions.HTTPException: Raised by src_stream while reading
+        """
+        try:
+            # Construct full remote path
+            full_remote_path = self._remote(remote_path)
+            
+            # Create remote directories if needed
+            if create_dirs:
+                remote_dir = str(Path(full_remote_path).parent)
+                self._ensure_remote_dir(remote_dir)
+            
+            logger.info(f"Uploading stream to {full_remote_path}")
+            
+            file_size, sha256 = self._write_remote(src_stream, full_remote_path)
+            
+            logger.info(f"Upload completed: {file_size} bytes")
+            
+            return {
+                'status': 'success',
+                'remote_path': full_remote_path,
+                'size_bytes': file_size,
+                'sha256': sha256,
+                'message': 'File uploaded successfully'
+            }
+            
+        except _PASSTHROUGH_ERRORS:
+            # The partial upload was already discarded by _write_remote
+            raise
+        except Exception as e:
+            logger.error(f"Upload failed: {e}")
+            return {
+                'status': 'error',
+                'remote_path': remote_path,
+                'error': str(e)
+            }
+    
+    def _write_remote(self, src_stream: BinaryIO, full_remote_path: str) -> Tuple[int, str]:
+        """Copy a stream into a remote file, returning its size and SHA-256 hex digest"""
+        # Hashing in the copy loop saves a second pass over the data, OpenSSL
+        # uses the CPU's SHA extensions where available
+        digest = hashlib.sha256()
+        
+        # Stream into a temporary name and only replace the target once the
+        # whole source was written, an aborted upload leaves the share intact
+        temp_path = self._temp_remote(full_remote_path)
+        try:
+            # Write through the raw handle so chunks are not copied into a buffer
+            with smbclient.open_file(temp_path, mode='wb', buffering=0,
+                                     connection_cache=self._cache) as remote_f:
+                while True:
+                    chunk = src_stream.read(self.chunk_write)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    self._write_all(remote_f, chunk)
+                file_size = remote_f.tell()
+            
+            smbclient.replace(temp_path, full_remote_path, connection_cache=self._cache)
+        except BaseException:
+            self._discard_remote(temp_path)
+            raise
+        
+        return file_size, digest.hexdigest()
+    
+    def _write_all(self, remote_f: BinaryIO, data: bytes):
+        """Write all of data to an unbuffered SMB handle"""
+        # A raw SMB write may accept less than it was given (credits,
+        # MaxWriteSize), so loop until the whole buffer is written
+        view = memoryview(data)
+        while view:
+            written = remote_f.write(view)
+            if not written:
+                raise OSError(f"SMB write made no progress on {remote_f.name}")
+            view = view[written:]
+    
+    def _temp_remote(self, full_remote_path: str) -> str:
+        """Build a unique temporary path next to a remote file"""
+        return f"{full_remote_path}.{uuid.uuid4().hex[:12]}.part"
+    
+    def _discard_remote(self, full_remote_path: str):
+        """Remove a leftover remote file, logging instead of raising"""
+        try:
+            smbclient.remove(full_remote_path, connection_cache=self._cache)
+        except Exception as e:
+            logger.warning(f"Could not remove partial upload {full_remote_path}: {e}")
+    
     def download_file(self, remote_path: str, local_path: str,
                      overwrite: bool = False) -> Dict[str, Any]:
         """
@@ -169,26 +430,21 @@ Args:
             local_file.parent.mkdir(parents=True, exist_ok=True)
             
             # Construct full remote path
-            full_remote_path = f"{self.server_url}/{remote_path.lstrip('/')}"
+            full_remote_path = self._remote(remote_path)
             
             # Check if remote file exists
-            if not smbclient.path.exists(full_remote_path):
+            if not smbclient.path.exists(full_remote_path, connection_cache=self._cache):
                 raise FileNotFoundError(f"Remote file not found: {full_remote_path}")
             
             # Download file
             logger.info(f"Downloading {full_remote_path} to {local_path}")
             
-            with smbclient.open_file(full_remote_path, mode='rb') as remote_f:
+            with smbclient.open_file(full_remote_path, mode='rb', buffering=0,
+                                     connection_cache=self._cache) as remote_f:
                 with open(local_file, 'wb') as local_f:
-                    # Copy file in chunks
-                    chunk_size = 64 * 1024  # 64KB chunks
-                    total_size = 0
-                    while True:
-                        chunk = remote_f.read(chunk_size)
-                        if not chunk:
-                            break
-                        local_f.write(chunk)
-                        total_size += len(chunk)
+                    shutil.copyfileobj(remote_f, local_f, length=self.chunk_read)
+            
+            total_size = local_file.stat().st_size
             
             logger.info(f"Download completed: {total_size} bytes")
             
@@ -209,38 +465,85 @@ Args:
                 'error': str(e)
             }
     
-    def list_files(self, remote_path: str = "") -> Dict[str, Any]:
+    def open_remote(self, remote_path: str) -> BinaryIO:
         """
-        List files in remote directory
+        Open a file on SMB share for streaming reads
         
         Args:
-            remote_path: Remote directory path (relative to share root)
+            remote_path: Path on SMB share (relative to share root)
             
         Returns:
-            Dictionary with file listing
+            Unbuffered binary file handle, the caller is responsible for closing it
         """
-        try:
-            full_remote_path = f"{self.server_url}/{remote_path.lstrip('/')}"
+        full_remote_path = self._remote(remote_path)
+        
+        logger.info(f"Opening {full_remote_path} for streaming")
+        
+        return smbclient.open_file(full_remote_path, mode='rb', buffering=0,
+                                   connection_cache=self._cache)
+    
+    def remote_file_info(self, remote_f: BinaryIO) -> Tuple[int, datetime]:
+        """
+        Get size and last write time of a handle returned by open_remote
+        
+        Both are known from the SMB CREATE response, no extra round-trip is made.
+        
+        Args:
+            remote_f: Open SMB file handle
             
-            logger.info(f"Listing files in {full_remote_path}")
+        Returns:
+            Tuple of size in bytes and timezone-aware last write time
+        """
+        return remote_f.fd.end_of_file, remote_f.fd.last_write_time
+    
+    def iter_files(self, remote_path: str = "") -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over files in remote directory as the listing arrives
+        
+        Args:
+            remote_path: Remote directory path (relative to share root)
             
-            files = []
-            for entry in smbclient.listdir(full_remote_path):
-                entry_path = f"{full_remote_path}/{entry}"
+        Yields:
+            Dictionary per directory entry
+        """
+        full_remote_path = self._remote(remote_path)
+        
+        logger.info(f"Listing files in {full_remote_path}")
+        
+        # Close the directory handle even when the consumer stops early
+        with smbclient.scandir(full_remote_path, connection_cache=self._cache) as it:
+            for entry in it:
                 try:
-                    stat_info = smbclient.stat(entry_path)
-                    files.append({
-                        'name': entry,
-                        'size': stat_info.st_size,
-                        'is_dir': smbclient.path.isdir(entry_path),
-                        'modified': stat_info.st_mtime
-                    })
+                    # Size and times come with the directory query itself,
+                    # so no per-entry stat round-trip is needed
+                    info = entry.smb_info
+                    file_info = {
+                        'name': entry.name,
+                        'size': info.end_of_file,
+                        'is_dir': entry.is_dir(),
+                        'modified': info.last_write_time.timestamp()
+                    }
                 except Exception as e:
-                    logger.warning(f"Could not stat {entry}: {e}")
-                    files.append({
-                        'name': entry,
+                    logger.warning(f"Could not stat {entry.name}: {e}")
+                    file_info = {
+                        'name': entry.name,
                         'error': str(e)
-                    })
+                    }
+                yield file_info
+    
+    def list_files(self, remote_path: str = "") -> Dict[str, Any]:
+        """
+        List files in remote directory
+        
+        Args:
+            remote_path: Remote directory path (relative to share root)
+            
+        Returns:
+            Dictionary with file listing
+        """
+        try:
+            full_remote_path = self._remote(remote_path)
+            files = list(self.iter_files(remote_path))
             
             return {
                 'status': 'success',
@@ -260,8 +563,8 @@ Args:
     def _ensure_remote_dir(self, remote_dir_path: str):
         """Create remote directory if it doesn't exist"""
         try:
-            if not smbclient.path.exists(remote_dir_path):
-                smbclient.makedirs(remote_dir_path)
+            if not smbclient.path.exists(remote_dir_path, connection_cache=self._cache):
+                smbclient.makedirs(remote_dir_path, connection_cache=self._cache)
                 logger.info(f"Created remote directory: {remote_dir_path}")
         except Exception as e:
             logger.warning(f"Could not create remote directory {remote_dir_path}: {e}")
@@ -270,7 +573,7 @@ Args:
         """Test SMB connection and signing status"""
         try:
             # Try to list the root directory
-            result = smbclient.listdir(self.server_url)
+            result = smbclient.listdir(self.server_url, connection_cache=self._cache)
             
             return {
                 'status': 'success',
@@ -293,31 +596,20 @@ Args:
     def close(self):
         """Clean up SMB session"""
         try:
-            # The smbclient handles session cleanup automatically
+            smbclient.reset_connection_cache(connection_cache=self._cache)
             logger.info("SMB session cleanup completed")
         except Exception as e:
             logger.warning(f"Error during cleanup: {e}")
 
 def load_config_from_env() -> SMBConfig:
     """Load configuration from environment variables"""
+    get = os.environ.get
     try:
-        config = SMBConfig(
-            server=os.getenv('SMB_SERVER', ''),
-            share=os.getenv('SMB_SHARE', ''),
-            username=os.getenv('SMB_USERNAME', ''),
-            password=os.getenv('SMB_PASSWORD', ''),
-            domain=os.getenv('SMB_DOMAIN', ''),
-            port=int(os.getenv('SMB_PORT', '445')),
-            require_signing=os.getenv('SMB_REQUIRE_SIGNING', 'true').lower() == 'true',
-            encrypt=os.getenv('SMB_ENCRYPT', 'false').lower() == 'true',
-            timeout=int(os.getenv('SMB_TIMEOUT', '30'))
-        )
-        
-        # Validate required fields
-        if not all([config.server, config.share, config.username, config.password]):
-            raise ValueError("Missing required environment variables: SMB_SERVER, SMB_SHARE, SMB_USERNAME, SMB_PASSWORD")
-        
-        return config
+        # SMBConfig validates the required fields itself
+        return SMBConfig(**{
+            field: cast(get(env_name, default))
+            for field, env_name, default, cast in _ENV_FIELDS
+        })
     except Exception as e:
         logger.error(f"Failed to load config from environment: {e}")
         raise
@@ -353,6 +645,8 @@ def main():
     upload_parser.add_argument('remote_path', help='Remote file path')
     upload_parser.add_argument('--no-create-dirs', action='store_true', 
                               help='Do not create remote directories')
+    upload_parser.add_argument('--parallel', type=int, default=1,
+                              help='Parallel writers for files over 16MB (default: 1)')
     
     # Download command
     download_parser = subparsers.add_parser('download', help='Download file')
@@ -395,10 +689,11 @@ def main():
     try:
         # Execute command
         if args.command == 'upload':
-            result = service.upload_file(
+            result = service.upload_file_parallel(
                 args.local_path, 
                 args.remote_path,
-                create_dirs=not args.no_create_dirs
+                create_dirs=not args.no_create_dirs,
+                parallel=args.parallel
             )
         elif args.command == 'download':
             result = service.download_file(
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+WSGI entrypoint for the SMB REST API
+Run in production with gevent workers, e.g.:
+
+    gunicorn -k gevent -w $(nproc) --worker-connections 1000 wsgi:app
+
+gunicorn patches the stdlib itself for gevent workers. Do not use --preload:
+smbclient keeps its connection cache per process and each worker has to
+register its own SMB session after the fork.
+"""
+
+from smb_api import app, init_smb_service_from_env
+
+if not init_smb_service_from_env():
+    raise RuntimeError("Failed to initialize SMB service from environment variables")
+
+__all__ = ['app']